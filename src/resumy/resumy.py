@@ -1,16 +1,26 @@
 import argparse
+import hashlib
 import logging
 import os
+import pickle
 import shutil
 import sys
 from datetime import datetime
-from typing import Any, Dict, cast
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple, cast
 
 import jinja2
 import yaml
-from jsonschema import ValidationError, validate
-from weasyprint import HTML  # type: ignore
-from weasyprint.document import DocumentMetadata  # type: ignore
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # libyaml is not available
+    from yaml import SafeDumper, SafeLoader  # type: ignore
+
+if TYPE_CHECKING:
+    from jsonschema.protocols import Validator
+    from weasyprint.document import DocumentMetadata  # type: ignore
 
 DATE_FORMAT = '%Y-%m-%d'
 DEFAULT_OUTPUT_FILENAME = 'out.pdf'
@@ -20,6 +30,23 @@ DEFAULT_SCHEMAS_DIR = 'schemas'
 DEFAULT_SCHEMA = 'jsonresume.yaml'
 DEFAULT_THEMES_DIR = 'themes'
 DEFAULT_THEME = 'prairie'
+STYLESHEET_EXTENSIONS = ('.css',)
+SKIP_VALIDATION_ENV = 'RESUMY_SKIP_VALIDATION'
+
+MODULE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCHEMAS_DIR = os.path.join(MODULE_DIR, DEFAULT_SCHEMAS_DIR)
+THEMES_DIR = os.path.join(MODULE_DIR, DEFAULT_THEMES_DIR)
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+    'resumy',
+)
+MONTHS = {
+    month: f'{index:02d}'
+    for index, month in enumerate(
+        ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'),
+        start=1,
+    )
+}
 
 # Type aliases
 Yaml = Dict[str, Any]
@@ -31,29 +58,125 @@ logger.setLevel(logging.INFO)
 
 def load_yaml(config_path: str) -> Yaml:
     config = {}
-    with open(config_path, 'r') as stream:
-        config = yaml.safe_load(stream)
+    with open(config_path, 'rb') as stream:
+        config = yaml.load(stream, Loader=SafeLoader)
     return config
 
 
-def validate_config(config: Yaml, schema_file: str) -> None:
-    if schema_file[0] != '/':
-        cur_dir = os.path.dirname(os.path.abspath(__file__))
-        schema_path = os.path.abspath(os.path.join(cur_dir, DEFAULT_SCHEMAS_DIR, schema_file))
-    else:
-        schema_path = schema_file
+def load_schema(schema_path: str) -> Yaml:
+    # Schemas barely change, so keep a pickled copy around to skip the yaml parsing
+    stat = os.stat(schema_path)
+    key = hashlib.blake2b(os.fsencode(os.path.abspath(schema_path)), digest_size=16).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f'{key}.pkl')
+    try:
+        with open(cache_path, 'rb') as cache:
+            mtime, size, schema = pickle.load(cache)
+        if mtime == stat.st_mtime_ns and size == stat.st_size:
+            return cast(Yaml, schema)
+    except Exception:
+        # Missing, unreadable or foreign cache entry: parse again and overwrite it
+        pass
+
     schema = load_yaml(schema_path)
-    validate(instance=config, schema=schema)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = f'{cache_path}.{os.getpid()}'
+        with open(tmp_path, 'wb') as cache:
+            pickle.dump((stat.st_mtime_ns, stat.st_size, schema), cache, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    except OSError as err:
+        logger.debug(f'cannot cache schema: {err}')
+    return schema
+
+
+@lru_cache(maxsize=8)
+def get_validator(schema_path: str, mtime: int, size: int) -> 'Validator':
+    from jsonschema.validators import validator_for
+
+    # Checking the schema against its meta-schema only needs to happen once,
+    # mtime and size are part of the cache key so that an edited schema is loaded again
+    schema = load_schema(schema_path)
+    cls = validator_for(schema)
+    cls.check_schema(schema)
+    return cls(schema)
+
+
+def get_schema_path(schema_file: str) -> str:
+    if not os.path.isabs(schema_file):
+        return os.path.join(SCHEMAS_DIR, schema_file)
+    return schema_file
+
+
+def validate_config(config: Yaml,
+                    schema_file: str,
+                    schema_stat: Optional[os.stat_result] = None) -> None:
+    from jsonschema.exceptions import best_match
+
+    schema_path = get_schema_path(schema_file)
+    if schema_stat is None:
+        schema_stat = os.stat(schema_path)
+    validator = get_validator(schema_path, schema_stat.st_mtime_ns, schema_stat.st_size)
+    error = best_match(validator.iter_errors(config))
+    if error is not None:
+        raise error
+
+
+def validate_config_once(config: Yaml, raw_config: bytes, schema_file: str) -> None:
+    # Rebuilding with an unchanged config and schema does not need another validation
+    schema_path = get_schema_path(schema_file)
+    stat = os.stat(schema_path)
+    config_hash = hashlib.blake2b(raw_config, digest_size=16).hexdigest()
+    schema_hash = hashlib.blake2b(
+        os.fsencode(f'{os.path.abspath(schema_path)}:{stat.st_mtime_ns}:{stat.st_size}'),
+        digest_size=16,
+    ).hexdigest()
+    validated_dir = os.path.join(CACHE_DIR, 'validated')
+    sentinel = os.path.join(validated_dir, f'{config_hash}-{schema_hash}')
+    if os.path.exists(sentinel):
+        return
+
+    # Validate against the very schema version the sentinel is named after
+    validate_config(config, schema_path, stat)
+    try:
+        os.makedirs(validated_dir, exist_ok=True)
+        open(sentinel, 'wb').close()
+    except OSError as err:
+        logger.debug(f'cannot cache validation: {err}')
+
+
+@lru_cache(maxsize=None)
+def get_theme_env(theme_path: str) -> jinja2.Environment:
+    # Keep one environment per theme so that compiled templates are reused across builds
+    return jinja2.Environment(
+        loader=jinja2.FileSystemLoader(theme_path),
+    )
+
+
+@lru_cache(maxsize=32)
+def read_stylesheet(css_path: str, mtime: int) -> str:
+    # mtime is only part of the cache key, so that an edited stylesheet is read again
+    with open(css_path, 'r', encoding='utf-8') as css_file:
+        return css_file.read()
+
+
+def collect_stylesheets(theme_path: str) -> List[Tuple[str, str]]:
+    with os.scandir(theme_path) as theme_lsdir:
+        return [
+            (entry.path, read_stylesheet(entry.path, entry.stat().st_mtime_ns))
+            for entry in theme_lsdir
+            if entry.name.endswith(STYLESHEET_EXTENSIONS) and entry.is_file()
+        ]
 
 
 def create_resume(config: Yaml,
                   output_file: str,
                   theme_path: str,
-                  metadata: DocumentMetadata) -> None:
+                  metadata: Optional['DocumentMetadata']) -> None:
+    # weasyprint is slow to import, only load it when a pdf is actually built
+    from weasyprint import CSS, HTML  # type: ignore
+
     # 1. Retrieve theme
-    env = jinja2.Environment(
-        loader=jinja2.FileSystemLoader(theme_path),
-    )
+    env = get_theme_env(theme_path)
     try:
         template = env.get_template('theme.html')
     except jinja2.exceptions.TemplateNotFound as err:
@@ -62,29 +185,32 @@ def create_resume(config: Yaml,
     # 2. Create a html from both the theme and the config file
     html_resume = template.render(config, strptime=datetime.strptime)
 
-    # 3. Add css automatically
-    css_list = []
-    theme_lsdir = os.listdir(theme_path)
-    for theme_file in theme_lsdir:
-        [_, ext] = os.path.splitext(theme_file)
-        if ext != '.css':
-            continue
-        css_list.append(os.path.join(theme_path, theme_file))
+    # 3. Add css automatically, from the cached file contents so that weasyprint
+    # does not fetch each file again
+    css_list = [
+        CSS(string=css, base_url=css_path)
+        for css_path, css in collect_stylesheets(theme_path)
+    ]
 
     # 4. Export a pdf
     html = HTML(string=html_resume, media_type='print')
     doc = html.render(
         stylesheets=css_list,
-        optimize_size=('fonts'),
+        optimize_size=('fonts',),
     )
-    doc.metadata = metadata
+    if metadata is not None:
+        doc.metadata = metadata
     logger.info(f'export to {output_file}')
     doc.write_pdf(output_file)
 
 
-def normalize_args(args: argparse.Namespace, config: Yaml) -> argparse.Namespace:
-    now = datetime.now().strftime(DATE_FORMAT)
+@lru_cache(maxsize=None)
+def get_today() -> str:
+    # Computed once per process, so that batch builds share the same date
+    return datetime.now().strftime(DATE_FORMAT)
+
 
+def normalize_args(args: argparse.Namespace, fullname: Optional[str]) -> argparse.Namespace:
     if args.auto_metadata:
         if not args.title:
             args.title = args.output
@@ -93,11 +219,11 @@ def normalize_args(args: argparse.Namespace, config: Yaml) -> argparse.Namespace
                 stat = os.stat(args.output)
                 args.created_date = datetime.fromtimestamp(stat.st_ctime).strftime(DATE_FORMAT)
             except FileNotFoundError:
-                args.created_date = now
+                args.created_date = get_today()
         if not args.modified_date:
-            args.modified_date = now
+            args.modified_date = get_today()
         if not args.author:
-            args.author = f"{config['profile']['firstname']} {config['profile']['lastname']}"
+            args.author = fullname
         if len(args.keyword) == 0:
             args.keyword = ['resume']
 
@@ -106,103 +232,125 @@ def normalize_args(args: argparse.Namespace, config: Yaml) -> argparse.Namespace
 
 def get_month_from(date: Yaml) -> str:
     if 'month' in date:
-        return datetime.strptime(date['month'], '%b').strftime('%m')
+        return MONTHS.get(date['month'].lower(), '01')
     return '01'
 
 
+def get_date_from(date: Yaml) -> str:
+    return f"{date['year']}-{get_month_from(date)}-01"
+
+
+def get_work_from(work: Yaml) -> Yaml:
+    new_work = {
+        'name': work['company_name'],
+        'position': work['title'],
+        'startDate': get_date_from(work['from']),
+        'highlights': work['description'],
+    }
+    if 'present' not in work and 'to' in work:
+        new_work['endDate'] = get_date_from(work['to'])
+    return new_work
+
+
+def get_education_from(edu: Yaml) -> Yaml:
+    new_edu = {
+        'institution': edu['company_name'],
+        'area': edu['title'],
+        'startDate': get_date_from(edu['from']),
+    }
+    if 'present' not in edu and 'to' in edu:
+        new_edu['endDate'] = get_date_from(edu['to'])
+    return new_edu
+
+
+def get_project_from(project: Yaml) -> Yaml:
+    new_project = {
+        'name': project['name'],
+        'description': project.get('description', ''),
+        'keywords': [skill['name'] for skill in project['skills']],
+    }
+    if 'url' in project:
+        new_project['url'] = project['url']
+    return new_project
+
+
 def from_resumy_to_jsonschema(config: Yaml) -> Yaml:  # noqa: C901
     profile = config['profile']
+    firstname = profile['firstname']
+    lastname = profile['lastname']
+    breaks: Yaml = {}
+    profiles: List[Yaml] = []
     new_config: Yaml = {
         'meta': {
-            'breaks_before': {},
+            'breaks_before': breaks,
         },
         'basics': {
-            'name': f"{profile['firstname']} {profile['lastname']}",
+            'name': f'{firstname} {lastname}',
             'email': profile['email'],
             'phone': profile['phone'],
             'url': profile['portfolio_url'],
-            'profiles': [],
+            'profiles': profiles,
         },
     }
-    if profile['city'] or profile['country']:
+    city = profile['city']
+    country = profile['country']
+    if city or country:
         new_config['basics']['location'] = {
-            'city': profile['city'],
-            'countryCode': profile['country'],
+            'city': city,
+            'countryCode': country,
         }
-    if profile['github_username']:
-        new_config['basics']['profiles'].append({
+    github_username = profile['github_username']
+    if github_username:
+        profiles.append({
             'network': 'Github',
-            'username': profile['github_username'],
-            'url': f"https://github.com/{profile['github_username']}",
+            'username': github_username,
+            'url': f'https://github.com/{github_username}',
         })
-    if profile['linkedin_username']:
-        new_config['basics']['profiles'].append({
+    linkedin_username = profile['linkedin_username']
+    if linkedin_username:
+        profiles.append({
             'network': 'Linkedin',
-            'username': profile['linkedin_username'],
-            'url': f"https://www.linkedin.com/{profile['linkedin_username']}",
+            'username': linkedin_username,
+            'url': f'https://www.linkedin.com/{linkedin_username}',
         })
-    if config['skills']:
-        if 'include_page_break' in config['skills']:
-            new_config['meta']['breaks_before']['skills'] = True
-        new_config['skills'] = []
-        for skillcat in config['skills']['content']:
-            new_config['skills'].append({
+    skills = config.get('skills')
+    if skills:
+        if 'include_page_break' in skills:
+            breaks['skills'] = True
+        new_config['skills'] = [
+            {
                 'name': skillcat['title'],
                 'keywords': [skill['name'] for skill in skillcat['content']],
-            })
-    if config['job_experience']:
-        if 'include_page_break' in config['job_experience']:
-            new_config['meta']['breaks_before']['work'] = True
-        new_config['work'] = []
-        for work in config['job_experience']['content']:
-            from_month = get_month_from(work['from'])
-            new_work = {
-                'name': work['company_name'],
-                'position': work['title'],
-                'startDate': f"{work['from']['year']}-{from_month}-01",
-                'highlights': work['description'],
-            }
-            if 'present' not in work and 'to' in work:
-                to_month = get_month_from(work['to'])
-                new_work['endDate'] = f"{work['to']['year']}-{to_month}-01"
-            new_config['work'].append(new_work)
-    if config['education']:
-        if 'include_page_break' in config['education']:
-            new_config['meta']['breaks_before']['education'] = True
-        new_config['education'] = []
-        for edu in config['education']['content']:
-            from_month = get_month_from(edu['from'])
-            new_edu = {
-                'institution': edu['company_name'],
-                'area': edu['title'],
-                'startDate': f"{edu['from']['year']}-{from_month}-01",
-            }
-            if 'present' not in work:
-                to_month = get_month_from(edu['to'])
-                new_work['endDate'] = f"{edu['to']['year']}-{to_month}-01"
-            new_config['education'].append(new_edu)
-    if config['projects']:
-        if 'include_page_break' in config['projects']:
-            new_config['meta']['breaks_before']['projects'] = True
-        new_config['projects'] = []
-        for project in config['projects']['content']:
-            new_project = {
-                'name': project['name'],
-                'description': project.get('description', ''),
-                'keywords': [skill['name'] for skill in project['skills']],
             }
-            if 'url' in project:
-                new_project['url'] = project['url']
-
-            new_config['projects'].append(new_project)
+            for skillcat in skills['content']
+        ]
+    job_experience = config.get('job_experience')
+    if job_experience:
+        if 'include_page_break' in job_experience:
+            breaks['work'] = True
+        new_config['work'] = [get_work_from(work) for work in job_experience['content']]
+    education = config.get('education')
+    if education:
+        if 'include_page_break' in education:
+            breaks['education'] = True
+        new_config['education'] = [get_education_from(edu) for edu in education['content']]
+    projects = config.get('projects')
+    if projects:
+        if 'include_page_break' in projects:
+            breaks['projects'] = True
+        new_config['projects'] = [get_project_from(project) for project in projects['content']]
     return new_config
 
 
 def cmd_build(args: argparse.Namespace) -> int:
+    from jsonschema import ValidationError
+
     try:
-        config = load_yaml(args.config_path)
-        if not args.disable_validation:
-            validate_config(config, args.schema)
+        with open(args.config_path, 'rb') as stream:
+            raw_config = stream.read()
+        config = yaml.load(raw_config, Loader=SafeLoader)
+        if not args.disable_validation and os.environ.get(SKIP_VALIDATION_ENV) != '1':
+            validate_config_once(config, raw_config, args.schema)
     except ValidationError as err:
         logger.error('Validation error')
         logger.error(err)
@@ -211,22 +359,24 @@ def cmd_build(args: argparse.Namespace) -> int:
         logger.error(err)
         return err.errno
 
-    args = normalize_args(args, config)
     # Not perfect but try to detect if the config is resumy or jsonresume friendly
     if 'version' in config and config['version'] == '0.0.1':
         config = from_resumy_to_jsonschema(config)
+    args = normalize_args(args, config.get('basics', {}).get('name'))
     theme_path = args.theme
-    if args.theme[0] != '/':
-        cur_dir = os.path.dirname(os.path.abspath(__file__))
-        theme_path = os.path.abspath(os.path.join(cur_dir, DEFAULT_THEMES_DIR, args.theme))
-
-    metadata = DocumentMetadata(
-        title=args.title,
-        authors=args.author,
-        keywords=args.keyword,
-        created=args.created_date,
-        modified=args.modified_date,
-    )
+    if not os.path.isabs(args.theme):
+        theme_path = os.path.join(THEMES_DIR, args.theme)
+
+    metadata = None
+    if any((args.title, args.author, args.keyword, args.created_date, args.modified_date)):
+        from weasyprint.document import DocumentMetadata
+        metadata = DocumentMetadata(
+            title=args.title,
+            authors=[args.author] if args.author else [],
+            keywords=args.keyword,
+            created=args.created_date,
+            modified=args.modified_date,
+        )
 
     try:
         create_resume(config, args.output, theme_path, metadata)
@@ -237,6 +387,8 @@ def cmd_build(args: argparse.Namespace) -> int:
 
 
 def cmd_validate(args: argparse.Namespace) -> int:
+    from jsonschema import ValidationError
+
     try:
         config = load_yaml(args.config_path)
         validate_config(config, args.schema)
@@ -250,20 +402,20 @@ def cmd_validate(args: argparse.Namespace) -> int:
 
 
 def cmd_init(args: argparse.Namespace) -> int:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    config_file = os.path.join(script_dir, 'config.example.yaml')
+    config_file = os.path.join(MODULE_DIR, 'config.example.yaml')
     shutil.copyfile(config_file, args.output)
     return 0
 
 
 def cmd_theme(args: argparse.Namespace) -> int:
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    theme_dir = os.path.join(script_dir, DEFAULT_THEMES_DIR, DEFAULT_THEME)
+    theme_dir = os.path.join(THEMES_DIR, DEFAULT_THEME)
     shutil.copytree(theme_dir, args.output)
     return 0
 
 
 def cmd_normalize(args: argparse.Namespace) -> int:
+    from jsonschema import ValidationError
+
     try:
         config = load_yaml(args.config_path)
         validate_config(config, 'resumy.yaml')
@@ -274,7 +426,7 @@ def cmd_normalize(args: argparse.Namespace) -> int:
 
     new_config = from_resumy_to_jsonschema(config)
     with open(args.output, 'w') as yfile:
-        yaml.dump(new_config, yfile)
+        yaml.dump(new_config, yfile, Dumper=SafeDumper)
 
     return 0
 
@@ -322,7 +474,8 @@ def main() -> int:
     )
     buildparser.add_argument(
         '--disable-validation', action='store_true',
-        help='Disable schema validation, in case you want your own customization',
+        help='Disable schema validation, in case you want your own customization '
+        f'(same as setting {SKIP_VALIDATION_ENV}=1)',
         )
     buildparser.add_argument(
         'config_path', type=str,